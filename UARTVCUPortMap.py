@@ -4,28 +4,28 @@ Classes:
     VCUPort: A data class representing various ports in a VCU system and their corresponding COM port addresses.
 Functions:
     map_vcu_ports(ports: serial.tools.list_ports_common.ListPortInfo) -> VCUPort:
+    comports() -> list:
+    set_low_latency(port) -> bool:
     main():
 """
 import argparse
 import json
+import os
 import platform
-import re
 import sys
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 import serial
-import serial.tools.list_ports  # Needed to patch the serial.tools.list_ports module on Windows
+import serial.tools.list_ports
 
-# If running on Windows patch the serial.tools.list_ports to the list_ports_windows local copy
-# To fix a known issue with the serial library on Windows not showing all information for FTDI devices
-PLATFORM_WINDOWS: bool = False
-if platform.system() == "Windows":
-    PLATFORM_WINDOWS = True
-    import list_ports_windows_patched_from_pyserial_3_5
-    serial.tools.list_ports = list_ports_windows_patched_from_pyserial_3_5  # Patch the serial.tools.list_ports module to enable identificatcon of serial ports on the FTDI serial hub
+PLATFORM_WINDOWS: bool = platform.system() == "Windows"
 
+# Attributes of serial.tools.list_ports_common.ListPortInfo printed in debug mode
+_PORT_FIELDS = ("device", "name", "description", "hwid", "vid", "pid", "serial_number", "location", "manufacturer", "product", "interface")
 
-@dataclass
+
+@dataclass(slots=True)
 class VCUPort:
     """
     A class representing a VCU (Vehicle Control Unit) port mapping for FTDI devices.
@@ -37,9 +37,8 @@ class VCUPort:
         SGA (Optional[str]): Signal Ground A port.
         JUMPERS (Optional[str]): Jumpers port.
     Methods:
-        get_location_regex(list_of_FTDI_major_location_numbers: list) -> dict:
-            Generates a dictionary of regex patterns for identifying port locations
-            based on the provided list of FTDI major location numbers.
+        as_dict() -> dict:
+            Returns the port mapping as a dictionary of attribute name to COM port address.
     """
     # list_of_FTDI_major_location_numbers: list  # List of FTDI major location numbers
     HPA: Optional[str] = None
@@ -49,30 +48,46 @@ class VCUPort:
     SGA: Optional[str] = None
     JUMPERS: Optional[str] = None
 
-    def get_location_regex(self, list_of_FTDI_major_location_numbers: list) -> dict:
-        self.FTDI1 = list_of_FTDI_major_location_numbers[0] if list_of_FTDI_major_location_numbers else None
-        self.FTDI2 = list_of_FTDI_major_location_numbers[1] if len(list_of_FTDI_major_location_numbers) > 1 else None
-        add_1_if_windows = 1 if PLATFORM_WINDOWS else 0
-
-        # print(f"FTDI1: {self.FTDI1}, FTDI2: {self.FTDI2}")
-        if self.FTDI2 is not None:  # if there are two FTDI devices (Sisyphos board)
-            return {
-                "HPA": rf".*{self.FTDI1}:1\.{0+add_1_if_windows}",
-                "HIA": rf".*{self.FTDI1}:1\.{3+add_1_if_windows}",
-                "HIB": rf".*{self.FTDI1}:1\.{2+add_1_if_windows}",
-                "LPA": rf".*{self.FTDI1}:1\.{1+add_1_if_windows}",
-                "SGA": rf".*{self.FTDI2}:1\.{0+add_1_if_windows}",
-                # "JUMPERS": rf".*{self.FTDI2}:1\.{1+add_1_if_windows}"
-                }
-        else:  # if there is only one FTDI device (verC board)
-            return {
-                "HPA": rf".*{self.FTDI1}:1\.{2+add_1_if_windows}",
-                "HIA": rf".*{self.FTDI1}:1\.{0+add_1_if_windows}",
-                "HIB": rf".*{self.FTDI1}:1\.{1+add_1_if_windows}",
-                "LPA": rf".*{self.FTDI1}:1\.{3+add_1_if_windows}",
-                "SGA": None,
-                # "JUMPERS": None
-                }
+    def as_dict(self) -> dict[str, Optional[str]]:
+        # A shallow copy is enough (and much cheaper than dataclasses.asdict) as long as all fields are plain strings/None, i.e. no nested dataclasses
+        return {attr: getattr(self, attr) for attr in VCUPort.__annotations__}
+
+
+@lru_cache(maxsize=4)
+def _build_location_map(list_of_FTDI_major_location_numbers: tuple, is_windows: bool) -> dict[tuple[str, int], str]:
+    """
+    Generates a dictionary mapping (FTDI major location number, interface number) tuples to the
+    VCUPort attribute name of the port found at that location.
+    The result is cached per FTDI major numbers as they rarely change between scans, the returned
+    dictionary is shared between calls and must not be modified.
+    Args:
+        list_of_FTDI_major_location_numbers (tuple): The sorted FTDI major location numbers.
+        is_windows (bool): The interface numbers on Windows start at 1 instead of 0.
+    Returns:
+        dict: The (major number, interface number) to attribute name lookup table.
+    """
+    FTDI1 = list_of_FTDI_major_location_numbers[0] if list_of_FTDI_major_location_numbers else None
+    FTDI2 = list_of_FTDI_major_location_numbers[1] if len(list_of_FTDI_major_location_numbers) > 1 else None
+    add_1_if_windows = 1 if is_windows else 0
+
+    # print(f"FTDI1: {FTDI1}, FTDI2: {FTDI2}")
+    if FTDI2 is not None:  # if there are two FTDI devices (Sisyphos board)
+        return {
+            (FTDI1, 0+add_1_if_windows): "HPA",
+            (FTDI1, 3+add_1_if_windows): "HIA",
+            (FTDI1, 2+add_1_if_windows): "HIB",
+            (FTDI1, 1+add_1_if_windows): "LPA",
+            (FTDI2, 0+add_1_if_windows): "SGA",
+            # (FTDI2, 1+add_1_if_windows): "JUMPERS",
+            }
+    else:  # if there is only one FTDI device (verC board)
+        return {
+            (FTDI1, 2+add_1_if_windows): "HPA",
+            (FTDI1, 0+add_1_if_windows): "HIA",
+            (FTDI1, 1+add_1_if_windows): "HIB",
+            (FTDI1, 3+add_1_if_windows): "LPA",
+            # SGA and JUMPERS are not available on the verC board
+            }
 
 
 def get_FTDI_devices_major_number(ports: list) -> list:
@@ -88,23 +103,15 @@ def get_FTDI_devices_major_number(ports: list) -> list:
     Returns:
         list: A sorted list of unique major numbers as strings.
     """
-    major_numbers = set()
-
-    for port in ports:
-        if port.location:  # Ensure the location field is not None
-            major_number = port.location.split(':')[0]  # Extract the major number (before the dot)
-            major_numbers.add(major_number)
-
-    # print(f"Unique major numbers: {sorted(major_numbers)}")
-    # print(f"Number of unique major numbers: {len(major_numbers)}")
-    return sorted(major_numbers)
+    # Extract the major number (before the colon), skipping ports where the location field is None
+    return sorted({port.location.partition(':')[0] for port in ports if port.location})
 
 
 def map_vcu_ports(ports: list) -> VCUPort:
     """
     Maps a list of ports to a VCUPort object based on their locations.
     This function identifies FTDI devices from the provided list of ports,
-    generates regex patterns for matching port locations, and assigns the
+    looks up each port location in the location map, and assigns the
     corresponding device names to the attributes of a VCUPort object.
     Args:
         ports (list): A list of port objects, where each port has attributes
@@ -115,47 +122,113 @@ def map_vcu_ports(ports: list) -> VCUPort:
     Notes:
         - The `get_FTDI_devices_major_number` function is used to identify FTDI
           devices from the provided ports.
-        - The `get_location_regex` method of the VCUPort class generates regex
-          patterns for matching port locations.
-        - Ports that do not match any regex pattern are skipped.
+        - The `_build_location_map` function generates (and caches) the
+          (major number, interface number) to attribute lookup table.
+        - Ports whose location is not in the lookup table are skipped.
     """
     port_map = VCUPort()
+    if not ports:
+        return port_map
+
     FTDI_devices = get_FTDI_devices_major_number(ports)
 
-    regex = port_map.get_location_regex(FTDI_devices)
-    # print(f'regex: {regex}')
+    location_map = _build_location_map(tuple(FTDI_devices), PLATFORM_WINDOWS)
+    # print(f'location_map: {location_map}')
     for port in ports:
-        for attr in VCUPort.__annotations__.keys():
-            if attr not in regex or regex[attr] is None:  # Skip attributes that do not have a corresponding regex pattern
-                continue
-            # print(f"Matching {attr} with regex: {regex[attr]} and port location: {port.location}")
-            if re.match(regex[attr], str(port.location)):  # Match the port's location with the regex pattern
-                setattr(port_map, attr, port.device)
+        location = port.location
+        if not location:  # Ensure the location field is not None
+            continue
+        # Locations have the format "<major>:<configuration>.<interface>", e.g. "1-1.2:1.0"
+        major_number, _, interface = location.partition(':')
+        configuration, _, interface_number = interface.partition('.')
+        if configuration != '1' or not interface_number.isdigit():  # Only configuration 1, other (e.g. "x." USB branch) locations are numbered differently
+            continue
+        attr = location_map.get((major_number, int(interface_number)))
+        if attr is not None:  # Ports without a corresponding location are skipped
+            setattr(port_map, attr, port.device)
 
     return port_map
 
 
-def print_output(label: str, output: object):
+def print_output(label: str, output: object, fields: tuple = _PORT_FIELDS):
     """
-    Print the attributes of a subprocess.CompletedProcess object.
+    Print the given attributes of an object, by default the fields of a serial.tools.list_ports_common.ListPortInfo object.
 
     :param label: A label to identify the output.
-    :param output: The subprocess.CompletedProcess object to print.
+    :param output: The object to print.
+    :param fields: The attribute names to print.
     """
     print(f'{label}:')
-    for attr in dir(output):
-        if not callable(getattr(output, attr)) and not attr.startswith('_'):
-            print(f'{attr}: {getattr(output, attr)}')
+    for attr in fields:
+        print(f'{attr}: {getattr(output, attr, None)}')
     print('#################################################################')
 
 
-def get_vcu_port_map(debug: bool = False, vid: int = 1027, pid: int = 24593) -> tuple[dict, bool]:
+def comports() -> list:
+    """
+    Returns the available serial ports as a list of serial.tools.list_ports_common.ListPortInfo objects.
+    If running on Windows the list_ports_windows local copy (patched from pyserial 3.5) is used instead of serial.tools.list_ports,
+    to fix a known issue with the serial library on Windows not showing all information for FTDI devices.
+    The patched module is only imported here, on first use, so importing this module stays cheap.
+    """
+    if PLATFORM_WINDOWS:
+        import list_ports_windows_patched_from_pyserial_3_5 as list_ports  # Enables identification of serial ports on the FTDI serial hub
+    else:
+        list_ports = serial.tools.list_ports
+    return list_ports.comports()
+
+
+def set_low_latency(port) -> bool:
+    """
+    Sets the FTDI latency timer of a port to 1 ms (the driver default is 16 ms), which otherwise limits
+    small-packet UART round trips to roughly 62 per second.
+    On Linux the value is written to /sys/class/tty/<tty>/device/latency_timer, which requires root or a udev rule.
+    The setting is lost when the device is reconnected, a permanent fix is a udev rule such as
+    /etc/udev/rules.d/99-ftdi-latency.rules containing:
+        ACTION=="add", SUBSYSTEM=="usb-serial", DRIVER=="ftdi_sio", ATTR{latency_timer}="1"
+    On Windows the FTDI D2XX API is used through the optional ftd2xx package, opening the device by serial number.
+    Note that the VCP driver may re-apply the latency timer configured in the Device Manager port settings.
+    Args:
+        port (serial.tools.list_ports_common.ListPortInfo): The port to configure.
+    Returns:
+        bool: True if the latency timer is set to 1 ms, False otherwise.
+    """
+    try:
+        if PLATFORM_WINDOWS:
+            try:
+                import ftd2xx
+            except ImportError:
+                print(f"Warning: Install the ftd2xx package to set the latency timer of {port.device}", file=sys.stderr)
+                return False
+            if not port.serial_number:
+                return False
+            device = ftd2xx.openEx(port.serial_number.encode())
+            try:
+                device.setLatencyTimer(1)
+            finally:
+                device.close()
+            return True
+
+        tty_name = os.path.basename(os.path.realpath(port.device))  # Resolve symlinks such as /dev/serial/by-id/...
+        latency_timer_path = f'/sys/class/tty/{tty_name}/device/latency_timer'
+        with open(latency_timer_path, 'r+', encoding='ascii') as latency_timer:
+            if latency_timer.read().strip() != '1':
+                latency_timer.seek(0)
+                latency_timer.write('1')
+        return True
+    except Exception as e:  # Setting the latency is best effort, the port map is still valid without it
+        print(f"Warning: Failed to set the latency timer of {port.device}: {e}", file=sys.stderr)
+        return False
+
+
+def get_vcu_port_map(debug: bool = False, vid: int = 1027, pid: int = 24593, low_latency: bool = False) -> tuple[dict, bool]:
     """
     Scans all available serial ports, filters for valid UART control ports based on the specified VID and PID,
     and returns a port map in dictionary format along with a boolean indicating if any valid ports were found.
     Args:
         vid (int): The Vendor ID (VID) to filter the serial ports. Default is 1027.
         pid (int): The Product ID (PID) to filter the serial ports. Default is 24593.
+        low_latency (bool): Set the FTDI latency timer of every mapped port to 1 ms, see `set_low_latency`.
     Returns:
             - A dictionary representing the port map.
     Debug Information:
@@ -164,29 +237,35 @@ def get_vcu_port_map(debug: bool = False, vid: int = 1027, pid: int = 24593) ->
             - A list of valid ports that match the specified VID and PID.
             - The generated port map in dictionary format.
     """
-    ports = serial.tools.list_ports.comports()
-    valid_ports = []  # list of valid ports
-    invalid_ports = []  # list of invalid ports
-
-    for port in sorted(ports):
-        if port.vid == vid and port.pid == pid:
-            valid_ports.append(port)
-        else:
-            invalid_ports.append(port)
+    ports = comports()
+    target = (vid, pid)
+    valid_ports = [port for port in ports if (port.vid, port.pid) == target]  # list of valid ports
 
     if debug:
+        # The port order only matters for readable debug output, the mapping is done by location
+        invalid_ports = [port for port in ports if (port.vid, port.pid) != target]  # list of invalid ports
         print("\n################# Invalid Ports:")
-        for port in invalid_ports:
+        for port in sorted(invalid_ports):
             print_output(f'{port.device}', port)
 
         print("\n################# Valid Ports:")
-        for port in valid_ports:
+        for port in sorted(valid_ports):
             print_output(f'{port.device}', port)
 
         print("\n################# Port map:")
 
-    port_map = asdict(map_vcu_ports(valid_ports))
-    return port_map, bool(valid_ports)
+    if not valid_ports:  # No supported UART board connected, nothing to map
+        return VCUPort().as_dict(), False
+
+    port_map = map_vcu_ports(valid_ports).as_dict()
+
+    if low_latency:
+        mapped_devices = set(port_map.values())
+        for port in valid_ports:
+            if port.device in mapped_devices:
+                set_low_latency(port)
+
+    return port_map, True
 
 
 def main():
@@ -195,10 +274,14 @@ def main():
     """
     argparser = argparse.ArgumentParser(description="List all serial ports and filter valid ones for uart_control. Select a port by serial number or COM port.")
     argparser.add_argument("--debug", "-d", action="store_true", help="Enable debug mode")
+    argparser.add_argument("--low-latency", action="store_true", help="Set the FTDI latency timer of the mapped ports to 1 ms (Linux: requires root or a udev rule, Windows: requires the ftd2xx package)")
     args = argparser.parse_args()
 
-    port_map, valid_ports = get_vcu_port_map(debug=args.debug)
-    json_output = json.dumps(port_map, indent=4)
+    port_map, valid_ports = get_vcu_port_map(debug=args.debug, low_latency=args.low_latency)
+    if sys.stdout.isatty():
+        json_output = json.dumps(port_map, indent=4)  # Pretty print for humans
+    else:
+        json_output = json.dumps(port_map, separators=(',', ':'))  # Compact output when piped to another program
     print(json_output)
 
     if not valid_ports:
@@ -2,142 +2,433 @@
 This module provides functionality to generate an executable from a Python script using PyInstaller.
 It supports building the executable either locally or within a development container.
 Functions:
-- run_pyinstaller(script: str, workpath: str): Runs PyInstaller to create a one-file bundled executable.
-- print_output(label: str, output: subprocess.CompletedProcess): Prints the attributes of a subprocess.CompletedProcess object.
+- run_pyinstaller(script: str, workpath: str, clean: bool): Runs PyInstaller to create a one-file bundled executable.
+- build_executables_locally(scripts, workpath: str, clean: bool): Builds the scripts locally with PyInstaller, in parallel (a single script in-process).
+- serve_builds(scripts, workpath: str, clean: bool): Builds the scripts one after another in one process.
+- run_streamed(command: list): Runs a command, streams its output and returns its last JSON stdout line.
+- open_container_shell(devcontainer_path: str): Starts one long-running shell inside the development container.
+- run_in_container_shell(shell: subprocess.Popen, command: list): Runs a command in that shell and streams its output.
+- docker_engine_running(docker_path: str): Checks (and briefly caches) if the docker engine is running.
+- build_devcontainer_image(devcontainer_path: str, use_image_cache: bool, push_image_cache: bool): Builds the development container image, optionally with a registry layer cache.
+- devcontainer_config_hash(): Hashes the development container configuration.
+- uv_dependency_hash(): Hashes the dependency files the development container venv is synced from.
+- get_container_name(): Gets the name of the development container of this workspace.
 - build_executable_in_devcontainer(): Builds a (Linux) executable in a development container.
 Usage:
-- Run the script without any flags to build both locally & in a development container.
+- Run the script without any flags to build both locally & in a development container (concurrently), on a Linux host only locally.
+- Run the script with the --cross flag on a Linux host to also build in a development container.
 - Run the script with the --container flag to build and run in a development container.
 - Run the script with the --local flag to build and run locally.
-- FileNotFoundError: If the 'devcontainer' command is not available in the PATH.
+- Run the script with the --reuse flag to choose if the development container is removed, paused or kept running (default) after the build.
+- Run the script with the --rebuild-image flag to rebuild the development container image (using a registry layer cache),
+  it is also rebuilt automatically (without the registry cache) when the .devcontainer configuration changed since the last build.
+- Run the script with the --clean flag to discard the PyInstaller cache and do a full (slower) build.
+- FileNotFoundError: If the 'devcontainer' or 'docker' command is not available in the PATH.
 - ValueError: If the containerId cannot be retrieved from the devcontainer output.
 - Exception: If the platform is unsupported.
 """
-import argparse
+import hashlib
+import io
 import json
 import os
 import platform
+import shlex
 import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 
-import PyInstaller.__main__
+PLATFORM_SYSTEM: str = platform.system()  # Resolved once, used for all the platform specific branches below
 
+CONTAINER_WORKPATH = 'buildLinux'  # The work path used by the (Linux) build inside the devcontainer
+CONTAINER_SHELL_DONE_MARKER = '__DONE__'  # Echoed with the exit code after each command sent to the devcontainer shell
+# A successful 'docker info' check is remembered in this file for DOCKER_PREFLIGHT_MAX_AGE seconds
+DOCKER_PREFLIGHT_STAMP = os.path.join(os.path.expanduser('~'), '.cache', 'evil-uart', 'docker-ok')
+DOCKER_PREFLIGHT_MAX_AGE = 5 * 60
+# Registry used as BuildKit layer cache when (re)building the devcontainer image
+DEVCONTAINER_IMAGE_CACHE = 'ghcr.io/viktorholck/evil-uart-devcontainer:buildcache'
+# Hash of the .devcontainer configuration the image was last built from, the image is rebuilt when it changes
+DEVCONTAINER_DIR = '.devcontainer'
+DEVCONTAINER_BUILD_HASH_FILE = os.path.join(DEVCONTAINER_DIR, '.last-build-hash')
+# Hash of the dependency files the devcontainer venv was last synced with, 'uv sync' is skipped while it matches
+DEVCONTAINER_UV_SYNC_MARKER = os.path.join(DEVCONTAINER_DIR, '.uv-synced')
+UV_DEPENDENCY_FILES = ('pyproject.toml', 'uv.lock')
+# What to do with the devcontainer after the build: remove it, pause it or keep it running for the next build
+CONTAINER_REUSE_MODES = ('none', 'pause', 'keep_alive')
 
-def run_pyinstaller(script: str, workpath: str):
+
+def run_pyinstaller(script: str, workpath: str, clean: bool = False):
     """
     Run PyInstaller to create a one-file bundled executable.
 
     :param script: The script to be bundled into an executable.
     :param workpath: The directory to use for the build process.
+    :param clean: Clean the PyInstaller cache and build directory before building.
     """
-    PyInstaller.__main__.run([
+    import PyInstaller.__main__  # Imported here as it is slow to import and not needed for container only builds
+
+    pyinstaller_args = [
         script,
         '--onefile',  # Create a one-file bundled executable
         '--workpath', workpath,  # The directory to use for the build process
-        '--icon', 'team-evil.ico',
-        '--clean'  # Clean the build directory before building, makes the build slower but more reliable
-    ])
+        '--specpath', workpath,  # Keep the generated .spec file per work path so concurrent local and container builds don't overwrite each other's
+        '--icon', os.path.abspath('team-evil.ico'),  # Absolute, relative paths are resolved against the spec path
+    ]
+    if clean:
+        # Clean the build directory before building, makes the build slower but more reliable.
+        # Without it PyInstaller reuses the cached analysis in the work path for incremental rebuilds.
+        pyinstaller_args.append('--clean')
+    PyInstaller.__main__.run(pyinstaller_args)
+
+
+def _run_pyinstaller_in_worker(script: str, workpath: str, clean: bool, config_dir: str):
+    """
+    Run PyInstaller in a worker process with its own PyInstaller cache directory.
+    Concurrent builds sharing one cache can corrupt the cached (stripped/compressed) binaries.
+
+    :param script: The script to be bundled into an executable.
+    :param workpath: The directory to use for the build process.
+    :param clean: Clean the PyInstaller cache and build directory before building.
+    :param config_dir: The base directory for the per script PyInstaller cache directories.
+    """
+    os.environ['PYINSTALLER_CONFIG_DIR'] = os.path.join(config_dir, os.path.splitext(os.path.basename(script))[0])
+    run_pyinstaller(script, workpath, clean)
+
+
+def _pyinstaller_config_dir(workpath: str) -> str:
+    """
+    Get the base directory of the per script PyInstaller cache directories, PYINSTALLER_CONFIG_DIR if set
+    (e.g. by the devcontainer) or <workpath>/pyinstaller-config.
+    Stable per script directories (not per process) so the cache is reused by the next build.
+    """
+    return os.environ.get('PYINSTALLER_CONFIG_DIR', os.path.join(workpath, 'pyinstaller-config'))
+
+
+def build_executables_locally(scripts, workpath: str, clean: bool = False):
+    """
+    Build each requested script locally, the scripts are independent and are built in parallel worker processes.
+    PyInstaller keeps the build files of each script in its own <workpath>/<script name> directory, the
+    cache directory is separated per script by _run_pyinstaller_in_worker.
+
+    :param scripts: An iterable of script filenames.
+    :param workpath: The directory to use for the build process.
+    :param clean: Clean the PyInstaller cache and build directory before building.
+    """
+    scripts = list(scripts)
+    config_dir = _pyinstaller_config_dir(workpath)
+    if len(scripts) == 1:  # Nothing to run in parallel, build in this process instead of starting a worker
+        _run_pyinstaller_in_worker(scripts[0], workpath, clean, config_dir)
+        return
+    with ProcessPoolExecutor(max_workers=min(len(scripts), os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(_run_pyinstaller_in_worker, script, workpath, clean, config_dir) for script in scripts]
+        for future in futures:
+            future.result()  # Re-raise any error from the build
+
+
+def serve_builds(scripts, workpath: str, clean: bool = False) -> int:
+    """
+    Build the scripts one after another in this process, so Python and PyInstaller are started (imported) once
+    for all of them. Each script uses its own PyInstaller cache directory, like the parallel local builds.
+    A failed build is reported and the remaining scripts are still built.
+    Used inside the devcontainer by build_executable_in_devcontainer (generateExecutable.py --serve).
 
+    :param scripts: An iterable of script filenames.
+    :param workpath: The directory to use for the build process.
+    :param clean: Clean the PyInstaller cache and build directory before building.
+    :return: 0 if all scripts were built, 1 otherwise.
+    """
+    config_dir = _pyinstaller_config_dir(workpath)  # Resolved once, each build points PYINSTALLER_CONFIG_DIR to its own subdirectory
+    failed = []
+    for script in scripts:
+        try:
+            _run_pyinstaller_in_worker(script, workpath, clean, config_dir)
+        except SystemExit as e:  # PyInstaller exits on build errors, most with the error message as exit code
+            if e.code not in (None, 0):
+                if isinstance(e.code, str):
+                    print(f"Error: building {script} failed: {e.code}", file=sys.stderr)
+                failed.append(script)
+        except Exception as e:
+            print(f"Error: building {script} failed: {e}", file=sys.stderr)
+            failed.append(script)
+    if failed:
+        print(f"Error: failed to build {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_streamed(command: list) -> str | None:
+    """
+    Run a command and stream its stdout to the console line by line, instead of buffering all of it in
+    memory until the command has finished. stderr (e.g. the 'devcontainer up' log) goes straight to the console.
+
+    :param command: The command (argv list) to run.
+    :return: The last stdout line that looks like a JSON object (e.g. the result of 'devcontainer up'), or None.
+    :raises subprocess.CalledProcessError: If the command fails.
+    """
+    last_json_line = None
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=None, text=True, encoding='utf-8', errors='replace', bufsize=1) as proc:
+        for line in proc.stdout:
+            sys.stdout.write(line)
+            if line.lstrip().startswith('{'):
+                last_json_line = line
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command)
+    return last_json_line
+
+
+def open_container_shell(devcontainer_path: str) -> subprocess.Popen:
+    """
+    Start one long-running bash shell inside the devcontainer, commands are sent to it with run_in_container_shell.
+    This pays the devcontainer exec startup once instead of once per command.
 
-def print_output(label: str, output: subprocess.CompletedProcess):
+    :param devcontainer_path: The resolved path of the devcontainer command.
+    :return: The shell process, its stderr is merged into stdout.
     """
-    Print the attributes of a subprocess.CompletedProcess object.
+    shell = subprocess.Popen(
+        [devcontainer_path, 'exec', '--workspace-folder', '.', 'bash'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    # Always send '\n' line endings, a text mode pipe on Windows would send '\r\n' which bash takes as part of the command
+    shell.stdin = io.TextIOWrapper(shell.stdin, encoding='utf-8', newline='\n', write_through=True)
+    shell.stdout = io.TextIOWrapper(shell.stdout, encoding='utf-8', errors='replace')
+    return shell
+
+
+def run_in_container_shell(shell: subprocess.Popen, command: list):
+    """
+    Run a command in the devcontainer shell and stream its output to the console.
+    The command is followed by an echo of CONTAINER_SHELL_DONE_MARKER and the exit code, the output
+    is forwarded until that marker is read.
 
-    :param label: A label to identify the output.
-    :param output: The subprocess.CompletedProcess object to print.
+    :param shell: The shell process started by open_container_shell.
+    :param command: The command (argv list) to run inside the container.
+    :raises subprocess.CalledProcessError: If the command fails or the shell exits.
     """
-    print(f'{label}:')
-    for attr in dir(output):
-        if not callable(getattr(output, attr)) and not attr.startswith('_'):
-            print(f'{attr}: {getattr(output, attr)}')
-    print('#################################################################')
+    # stdin is redirected so the command can't consume the commands that are sent to the shell after it
+    try:
+        shell.stdin.write(f'{shlex.join(command)} < /dev/null\necho "{CONTAINER_SHELL_DONE_MARKER}:$?"\n')
+        shell.stdin.flush()
+    except BrokenPipeError:  # The shell already exited
+        raise subprocess.CalledProcessError(shell.wait(), command) from None
+    for line in shell.stdout:
+        output, marker, returncode = line.rpartition(f'{CONTAINER_SHELL_DONE_MARKER}:')
+        if not marker:
+            sys.stdout.write(line)
+            continue
+        sys.stdout.write(output)  # Output of the command that did not end with a newline
+        if int(returncode) != 0:
+            raise subprocess.CalledProcessError(int(returncode), command)
+        return
+    raise subprocess.CalledProcessError(shell.wait(), command)  # The shell exited before the command finished
 
 
-def build_executable_in_devcontainer(scripts):
+def docker_engine_running(docker_path: str) -> bool:
+    """
+    Check if the docker engine is running with 'docker info', which can take most of a second (Docker Desktop).
+    The check is skipped if it succeeded less than DOCKER_PREFLIGHT_MAX_AGE seconds ago, a docker engine
+    stopped in the meantime is still reported by 'devcontainer up'.
+
+    :param docker_path: The resolved path of the docker command.
+    :return: True if the docker engine is running (or was recently), False otherwise.
+    """
+    try:
+        if time.time() - os.path.getmtime(DOCKER_PREFLIGHT_STAMP) < DOCKER_PREFLIGHT_MAX_AGE:
+            return True
+    except OSError:
+        pass  # No (readable) stamp file, run the check
+
+    try:
+        subprocess.run([docker_path, 'info'], shell=False, capture_output=True, text=True, check=True, encoding='utf-8')
+    except subprocess.CalledProcessError:
+        return False
+
+    try:
+        os.makedirs(os.path.dirname(DOCKER_PREFLIGHT_STAMP), exist_ok=True)
+        with open(DOCKER_PREFLIGHT_STAMP, 'w', encoding='utf-8'):
+            pass  # Only the modification time is used
+    except OSError:
+        pass  # Caching the result is optional
+    return True
+
+
+def get_container_name() -> str:
+    """
+    Get the name of the devcontainer, as set by the runArgs in .devcontainer/devcontainer.json
+    (${containerWorkspaceFolderBasename}_devcontainer), the name is the same for every build of this workspace.
+    """
+    return f'{os.path.basename(os.getcwd())}_devcontainer'
+
+
+def build_devcontainer_image(devcontainer_path: str, use_image_cache: bool = False, push_image_cache: bool = False):
+    """
+    Build the devcontainer image, optionally using the layers cached in DEVCONTAINER_IMAGE_CACHE so unchanged
+    layers are pulled instead of rebuilt.
+
+    :param devcontainer_path: The resolved path of the devcontainer command.
+    :param use_image_cache: Pull the cached layers from DEVCONTAINER_IMAGE_CACHE.
+    :param push_image_cache: Also export the layers to DEVCONTAINER_IMAGE_CACHE (requires push access, e.g. in CI).
+    :raises subprocess.CalledProcessError: If the build fails.
+    """
+    build_cmd = [devcontainer_path, 'build', '--workspace-folder', '.']
+    if use_image_cache or push_image_cache:
+        build_cmd += ['--cache-from', f'type=registry,ref={DEVCONTAINER_IMAGE_CACHE}']
+    if push_image_cache:
+        build_cmd += ['--cache-to', f'type=registry,ref={DEVCONTAINER_IMAGE_CACHE},mode=max']
+    run_streamed(build_cmd)
+
+
+def devcontainer_config_hash() -> str:
+    """
+    Hash the devcontainer configuration, i.e. the names and contents of the files in DEVCONTAINER_DIR
+    (devcontainer.json, a Dockerfile, ...). Hidden files are skipped as they hold local state such as
+    DEVCONTAINER_BUILD_HASH_FILE.
+
+    :return: The SHA-256 hex digest of the configuration.
+    """
+    digest = hashlib.sha256()
+    for entry in sorted(os.scandir(DEVCONTAINER_DIR), key=lambda entry: entry.name):
+        if entry.name.startswith('.') or not entry.is_file():
+            continue
+        digest.update(entry.name.encode('utf-8') + b'\0')
+        with open(entry.path, 'rb') as config_file:
+            digest.update(config_file.read())
+    return digest.hexdigest()
+
+
+def uv_dependency_hash() -> str:
+    """
+    Hash the files uv syncs the virtual environment from (UV_DEPENDENCY_FILES), missing files are skipped.
+
+    :return: The SHA-256 hex digest of the dependency files.
+    """
+    digest = hashlib.sha256()
+    for name in UV_DEPENDENCY_FILES:
+        try:
+            with open(name, 'rb') as dependency_file:
+                digest.update(name.encode('utf-8') + b'\0' + dependency_file.read())
+        except FileNotFoundError:
+            continue
+    return digest.hexdigest()
+
+
+def build_executable_in_devcontainer(scripts, clean: bool = False, reuse: str = 'keep_alive', rebuild_image: bool = False, push_image_cache: bool = False):
     """
     Build one or more (linux) executables in a development container.
 
-    `scripts` is an iterable of script filenames. The devcontainer is started once,
-    `uv sync`/the venv is prepared once and then each script is built sequentially.
+    `scripts` is an iterable of script filenames. The devcontainer is started once, one shell is
+    opened inside it, `uv sync`/the venv is prepared once and then each script is built sequentially by one
+    Python process (generateExecutable.py --serve, see serve_builds).
+    `clean` is forwarded as --clean to the builds inside the container.
+    `reuse` is one of CONTAINER_REUSE_MODES: 'none' stops and removes the container after the build,
+    'pause' pauses it and 'keep_alive' leaves it running so the next build skips the container startup.
+    The devcontainer image is (re)built first when the configuration changed since the last successful build
+    (see devcontainer_config_hash), or with the registry layer cache when `rebuild_image` or `push_image_cache`
+    is set, `push_image_cache` also exports the layer cache.
+    Returns 0 if the build succeeded and 1 otherwise, the error is printed (no sys.exit as this runs in a worker thread of main).
     """
     try:
         # Check if the devcontainer command is available
         devcontainer_path = shutil.which('devcontainer')
         if devcontainer_path is None:
             raise FileNotFoundError("The 'devcontainer' command is not available in your PATH.")
+        # Resolve docker once as well, all commands are run without a shell using the resolved paths
+        docker_path = shutil.which('docker')
+        if docker_path is None:
+            raise FileNotFoundError("The 'docker' command is not available in your PATH.")
 
         # Check if docker engine is running
-        try:
-            subprocess.run(['docker', 'info'], shell=True, capture_output=True, text=True, check=True, encoding='utf-8')
-        except subprocess.CalledProcessError:
+        if not docker_engine_running(docker_path):
             print("Error: Docker engine is not running. Please start Docker and try again.")
-            sys.exit(1)
+            return 1
+
+        # Build the development container, only if the configuration changed since the last build (or when asked for)
+        config_hash = devcontainer_config_hash()
+        try:
+            with open(DEVCONTAINER_BUILD_HASH_FILE, encoding='utf-8') as hash_file:
+                last_build_hash = hash_file.read().strip()
+        except OSError:
+            last_build_hash = config_hash  # No build recorded yet (e.g. a fresh checkout), 'devcontainer up' creates a missing container itself
+        image_rebuilt = rebuild_image or push_image_cache or config_hash != last_build_hash
+        if image_rebuilt:
+            build_devcontainer_image(devcontainer_path, use_image_cache=rebuild_image, push_image_cache=push_image_cache)
 
-        # Build the development container
-        # build_result = subprocess.run(['devcontainer', 'build', '--workspace-folder', '.'], shell=True, capture_output=True, text=True, check=True, encoding='utf-8')
-        # print_output("Container build", build_result)
+        # Resume a container paused by a previous build, 'devcontainer up' reuses (and starts) an existing container itself
+        container_name = get_container_name()
+        inspect_result = subprocess.run([docker_path, 'inspect', '--format', '{{.State.Status}}', container_name], shell=False, capture_output=True, text=True, encoding='utf-8')
+        if inspect_result.returncode == 0 and inspect_result.stdout.strip() == 'paused':
+            subprocess.run([docker_path, 'unpause', container_name], shell=False, check=True)
 
         # Run the development container
-        up_result = subprocess.run(['devcontainer', 'up', '--workspace-folder', '.'], shell=True, capture_output=True, text=True, check=True, encoding='utf-8')
-        print_output("Container up", up_result)
+        up_cmd = [devcontainer_path, 'up', '--workspace-folder', '.']
+        if image_rebuilt:
+            up_cmd.append('--remove-existing-container')  # A kept alive/paused container still runs the old image and configuration
+        up_result = run_streamed(up_cmd)
 
-        # Parse the JSON output to get the containerId
-        container_info = json.loads(up_result.stdout)
+        # Parse the JSON output (the last line) to get the containerId
+        try:
+            container_info = json.loads(up_result) if up_result else {}
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Failed to parse the devcontainer up output: {e}") from None
         container_id = container_info.get("containerId")
         # remote_workspace_folder = container_info.get("remoteWorkspaceFolder")
         if not container_id:
             raise ValueError("Failed to get containerId from the output")
-        # Run uv once to ensure the container-local venv is created and packages installed.
-        # We run a no-op uv command (or uv sync) before building scripts to ensure the environment.
-        uv_sync_cmd = ['devcontainer', 'exec', '--workspace-folder', '.', 'uv', 'sync']
-        if platform.system() == 'Windows':
-            cmd = ' '.join(uv_sync_cmd)
-            proc = subprocess.run(cmd, shell=True, capture_output=True, text=True, encoding='utf-8')
-        else:
-            proc = subprocess.run(uv_sync_cmd, shell=False, capture_output=True, text=True, encoding='utf-8')
+        # Only recorded once the container runs the configuration, a failed build or 'up' is retried by the next run
+        if image_rebuilt or not os.path.exists(DEVCONTAINER_BUILD_HASH_FILE):
+            with open(DEVCONTAINER_BUILD_HASH_FILE, 'w', encoding='utf-8') as hash_file:
+                hash_file.write(config_hash)
+        # All commands inside the container are run through one shell, the output is streamed to the console
+        shell = open_container_shell(devcontainer_path)
+        try:
+            # Run uv once to ensure the container-local venv is created and packages installed.
+            # The venv is kept in the workspace, skip the sync while the dependencies are unchanged since the last one
+            # ('uv run' still syncs a missing or outdated venv itself).
+            dependency_hash = uv_dependency_hash()
+            try:
+                with open(DEVCONTAINER_UV_SYNC_MARKER, encoding='utf-8') as marker_file:
+                    synced_hash = marker_file.read().strip()
+            except OSError:
+                synced_hash = None
+            if synced_hash != dependency_hash:
+                run_in_container_shell(shell, ['uv', 'sync'])
+                with open(DEVCONTAINER_UV_SYNC_MARKER, 'w', encoding='utf-8') as marker_file:
+                    marker_file.write(dependency_hash)
 
-        if proc.returncode != 0:
-            print('uv sync failed inside devcontainer:')
-            print('--- stdout ---')
-            print(proc.stdout)
-            print('--- stderr ---')
-            print(proc.stderr)
-            # raise to trigger the existing subprocess.CalledProcessError handler
-            raise subprocess.CalledProcessError(proc.returncode, getattr(proc, 'args', uv_sync_cmd))
-
-        # Build each script inside the running devcontainer sequentially.
-        for script in scripts:
-            list_cmd = [
-                'devcontainer', 'exec', '--workspace-folder', '.',
-                'uv', 'run', 'python', os.path.basename(__file__), '--local', '--script', script
-            ]
-
-            if platform.system() == 'Windows':
-                cmd_str = ' '.join(list_cmd)
-                # Stream output directly to the console for long-running builds
-                exec_result = subprocess.run(cmd_str, shell=True, check=True)
-            else:
-                # Stream output directly to the console for long-running builds
-                exec_result = subprocess.run(list_cmd, shell=False, check=True)
-
-            print_output(f"Script execution ({script})", exec_result)
+            # Build each script inside the running devcontainer sequentially, in one Python process.
+            serve_cmd = ['uv', 'run', 'python', '-u', os.path.basename(__file__), '--serve', '--script', *scripts]
+            if clean:
+                serve_cmd.append('--clean')
+            run_in_container_shell(shell, serve_cmd)
+        finally:
+            try:
+                shell.stdin.close()  # Ends the shell
+            except BrokenPipeError:
+                pass  # The shell already exited
+            shell.wait()
 
         # Stop and delete the container
-        # down_result = subprocess.run(['devcontainer', 'down', '--container-id', containerId], shell=True, capture_output=True, text=True, check=True)  # Not working in cli yet
+        # down_result = subprocess.run([devcontainer_path, 'down', '--container-id', containerId], shell=False, capture_output=True, text=True, check=True)  # Not working in cli yet
         # print("Container down: ", down_result)
 
-        # Stop and remove the container using Docker commands
-        stop_result = subprocess.run(['docker', 'stop', container_id], shell=True, capture_output=True, text=True, check=True, encoding='utf-8')
-        print_output("Container stop", stop_result)
-
-        remove_result = subprocess.run(['docker', 'rm', container_id], shell=True, capture_output=True, text=True, check=True)
-        print_output("Container remove", remove_result)
+        if reuse == 'none':
+            # Stop and remove the container using Docker commands, the output is streamed directly to the console
+            subprocess.run([docker_path, 'stop', container_id], shell=False, check=True)
+            subprocess.run([docker_path, 'rm', container_id], shell=False, check=True)
+        elif reuse == 'pause':
+            subprocess.run([docker_path, 'pause', container_id], shell=False, check=True)
+        else:
+            print(f"Keeping devcontainer {container_name} ({container_id}) running for the next build, use --reuse none to remove it.")
+        return 0
 
     except FileNotFoundError as e:
         print(f"Error: {e}")
-        print("Make sure the 'devcontainer' command is available in your PATH.")
-        sys.exit(1)
+        print("Make sure the 'devcontainer' and 'docker' commands are available in your PATH.")
+        return 1
+    except ValueError as e:  # No (valid) result from 'devcontainer up'
+        print(f"Error: {e}")
+        return 1
     except subprocess.CalledProcessError as e:
         # Print detailed subprocess output to help debugging when a command fails
         print(f"Error: command failed: {getattr(e, 'cmd', None)}")
@@ -152,13 +443,15 @@ def build_executable_in_devcontainer(scripts):
             print(e.stderr)
         except AttributeError:
             pass
-        sys.exit(1)
+        return 1
 
 
 def main():
     """
     Main function to parse arguments and trigger the build process.
     """
+    import argparse
+
     argparser = argparse.ArgumentParser(description="Generate executable for UARTVCUPortMap")
     argparser.add_argument(
         "--script",
@@ -169,23 +462,54 @@ def main():
     arg_build_group = argparser.add_mutually_exclusive_group()
     arg_build_group.add_argument("--container", help="Build and run in devcontainer", action="store_true")
     arg_build_group.add_argument("--local", help="Build and run locally", action="store_true")
+    arg_build_group.add_argument("--serve", help="Build the scripts one after another in this process (used inside the devcontainer)", action="store_true")
+    arg_build_group.add_argument("--cross", help="On a Linux host also build in the devcontainer (default: local build only as the host builds the same Linux executable)", action="store_true")
+    argparser.add_argument("--reuse", help="What to do with the devcontainer after the build: remove it (none), pause it (pause) or keep it running (keep_alive, default) so the next build starts faster", choices=CONTAINER_REUSE_MODES, default='keep_alive')
+    argparser.add_argument("--rebuild-image", help="Build the devcontainer image before the build even if .devcontainer is unchanged, using the registry layer cache", action="store_true")
+    argparser.add_argument("--push-image-cache", help="Like --rebuild-image and also push the layer cache to the registry (requires push access, e.g. CI)", action="store_true")
+    argparser.add_argument("--clean", help="Clean the PyInstaller cache and build directory before building (slower, full rebuild)", action="store_true")
     args = argparser.parse_args()
 
-    if not args.local:
-        # args.script is now a list of one or more script paths
-        build_executable_in_devcontainer(scripts=args.script)
+    # A Linux host builds the same executable as the (Linux) devcontainer, skip the container unless asked for
+    build_in_container = args.container or (not args.local and (PLATFORM_SYSTEM != "Linux" or args.cross))
+    build_locally = not args.container
 
-    if not args.container:
-        if platform.system() == "Windows":
+    WORKPATH = None
+    if build_locally:
+        if PLATFORM_SYSTEM == "Windows":
             WORKPATH = 'buildWindows'
-        elif platform.system() == "Linux":
+        elif PLATFORM_SYSTEM == "Linux":
             WORKPATH = 'buildLinux'
         else:
             raise RuntimeError('Unsupported platform')
 
-        # Build each requested script locally
-        for script in args.script:
-            run_pyinstaller(script, WORKPATH)
+    if args.serve:
+        sys.exit(serve_builds(args.script, WORKPATH, args.clean))
+
+    if not build_in_container:  # Only local builds, no need for the thread pool (e.g. the single script --local build)
+        build_executables_locally(args.script, WORKPATH, args.clean)
+        return
+
+    builds = []
+    if build_in_container:
+        # args.script is now a list of one or more script paths
+        builds.append(partial(build_executable_in_devcontainer, scripts=args.script, clean=args.clean, reuse=args.reuse,
+                              rebuild_image=args.rebuild_image, push_image_cache=args.push_image_cache))
+    if build_locally:
+        builds.append(partial(build_executables_locally, args.script, WORKPATH, args.clean))
+
+    # The container and local builds are independent processes and can overlap, unless they share the
+    # same work path (Linux host), then they would write the same build and dist files and run one after the other
+    if build_in_container and build_locally and WORKPATH != CONTAINER_WORKPATH:
+        with ThreadPoolExecutor(max_workers=len(builds)) as executor:
+            futures = [executor.submit(build) for build in builds]
+            returncodes = [future.result() for future in futures]  # Re-raise any error from the builds
+        if any(returncodes):  # The container build failed (and printed why)
+            sys.exit(1)
+    else:
+        for build in builds:
+            if build():  # Stop at the first failed build, the next one is not started
+                sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -4,9 +4,25 @@ import re
 import subprocess
 import platform
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
 
 import serial
 
+PLATFORM_SYSTEM: str = platform.system()  # Resolved once, used for the platform specific executable paths
+_SGA_LOGIN_RE = re.compile(rb'DoIP-.* login:')  # The SGA login prompt, matched against the raw serial response
+DEFAULT_BAUDRATE = 115200
+SERIAL_TIMEOUT = 1  # Seconds to wait for a response
+# The probe verify_uart_connection sends to each target: (command, expected prompt), the port is only opened for these targets
+_UART_PROBES = {
+    "HPA": ('uname -a', b'QNX hpa'),
+    "HIA": ('', b'GoForHIA>'),
+    "LPA": ('', b'Atmel LP->'),
+    "SGA": ('', b'login:'),  # Checked with _SGA_LOGIN_RE, which ends with 'login:'
+    "HIB": ('', b'GoForHIB>'),
+}
+
 
 def execute_and_get_json_output(target_path, use_script=False):
     """
@@ -43,7 +59,30 @@ def execute_and_get_json_output(target_path, use_script=False):
         print(f"Error decoding JSON output: {e}")
 
 
-def send_command_to_serial_device(uart_target: str, uart_target_port: str, baudrate: int = 115200, command: str = "", verbose: bool = True):
+def load_json_output(map_path):
+    """
+    Loads a port map saved from an earlier UARTVCUPortMap run (e.g. `UARTVCUPortMap > portmap.json`),
+    so the ports don't have to be scanned again for every test run.
+
+    Args:
+        map_path (str): The file path to the saved JSON port map.
+
+    Returns:
+        dict: The parsed JSON port map.
+
+    Notes:
+        - If the file can't be read or is not valid JSON, an error message is printed and None is returned.
+    """
+    try:
+        with open(map_path, encoding='utf-8') as map_file:
+            return json.load(map_file)
+    except OSError as e:
+        print(f"Error reading port map file: {e}")
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON port map: {e}")
+
+
+def send_command_to_serial_device(uart_target: str, uart_target_port: str, baudrate: int = DEFAULT_BAUDRATE, command: str = "", verbose: bool = True, log=print, expected: bytes | None = None, ser: serial.Serial | None = None):
     """
     Sends a command to a serial device and retrieves the response.
 
@@ -53,42 +92,48 @@ def send_command_to_serial_device(uart_target: str, uart_target_port: str, baudr
         baudrate (int, optional): The communication speed for the serial connection. Defaults to 115200.
         command (str, optional): The command string to send to the serial device. Defaults to an empty string.
         verbose (bool, optional): Whether to print the communication details. Defaults to True.
+        log (callable, optional): Called with each line to print. Defaults to print.
+        expected (bytes, optional): Stop reading as soon as this prompt is received instead of waiting for the timeout. Defaults to None.
+        ser (serial.Serial, optional): An already opened connection to `uart_target_port`, used (and left open) instead of
+            opening and closing the port for this command. Defaults to None.
 
     Returns:
-        str: The response received from the serial device, or None if an error occurs.
+        bytes: The raw response received from the serial device, or None if an error occurs.
 
     Raises:
         serial.SerialException: If there is an issue with the serial communication.
 
     Notes:
         - The command string is automatically appended with a carriage return ("\r") before being sent.
-        - The function reads up to 1024 bytes from the serial device as a response.
-        - The response is decoded from bytes to a string before being returned.
+        - The function reads up to 1024 bytes from the serial device as a response, until the `expected`
+          prompt (if given) is received or the 1 second timeout expires.
+        - The response is returned as bytes, it is only decoded (replacing invalid bytes) for display,
+          so noise on the UART can't make the check fail with a decode error.
     """
     try:
-        with serial.Serial(uart_target_port, baudrate, timeout=1) as ser:
-            ser.write((command + "\r").encode())
-            response = ser.read(1024).decode()
+        with serial.Serial(uart_target_port, baudrate, timeout=SERIAL_TIMEOUT) if ser is None else nullcontext(ser) as connection:
+            connection.write((command + "\r").encode())
+            response = connection.read_until(expected, 1024) if expected else connection.read(1024)
             if verbose:
                 # Clean up the response for display
-                clean_response = response.strip().replace('\n', ' ').replace('\r', '')
+                clean_response = response.decode(errors='replace').strip().replace('\n', ' ').replace('\r', '')
                 # if len(clean_response) > 60:
                 #     clean_response = clean_response[:57] + "..."
                 
                 # Show command and response separately for clarity
                 if command:
-                    print(f"  └─ Command: {command}")
-                    print(f"  └─ Response: {clean_response}")
+                    log(f"  └─ Command: {command}")
+                    log(f"  └─ Response: {clean_response}")
                 else:
-                    print("  └─ Command: (empty)")
-                    print(f"  └─ Response: {clean_response}")
+                    log("  └─ Command: (empty)")
+                    log(f"  └─ Response: {clean_response}")
             return response
     except serial.SerialException as e:
-        print(f"  └─ Error communicating with {uart_target} ({uart_target_port}): {e}")
+        log(f"  └─ Error communicating with {uart_target} ({uart_target_port}): {e}")
         return None
 
 
-def verify_uart_connection(uart_target, uart_target_port, verbose=False):
+def verify_uart_connection(uart_target, uart_target_port, verbose=False, log=print, ser=None):
     """
     Verifies the UART connection to a specified target by sending a command
     and checking the response for expected output.
@@ -101,39 +146,61 @@ def verify_uart_connection(uart_target, uart_target_port, verbose=False):
             - "HIB"
         uart_target_port (str): The port associated with the UART target.
         verbose (bool): Whether to show detailed communication logs.
+        log (callable): Called with each line of the communication logs. Defaults to print.
+        ser (serial.Serial): An already opened connection to `uart_target_port`, see `send_command_to_serial_device`.
     Returns:
         bool: True if the connection is verified based on the expected response
         for the given target, False otherwise.
     Notes:
-        - The function uses `send_command_to_serial_device` to send a command
-          to the specified UART target and port.
+        - The function uses `send_command_to_serial_device` to send the command
+          of the target in `_UART_PROBES` to the specified UART target and port.
         - The expected response varies depending on the `uart_target` value.
         - If the `uart_target` is not recognized, the function returns False.
     """
-    match uart_target:
-        case "HPA":
-            output = send_command_to_serial_device(uart_target, uart_target_port, command='uname -a', verbose=verbose)
-            return output and ('QNX hpa' in output)
-        case "HIA":
-            output = send_command_to_serial_device(uart_target, uart_target_port, command='', verbose=verbose)
-            return output and ('GoForHIA>' in output)
-        case "LPA":
-            output = send_command_to_serial_device(uart_target, uart_target_port, command='', verbose=verbose)
-            return output and ('Atmel LP->' in output)
-        case "SGA":
-            output = send_command_to_serial_device(uart_target, uart_target_port, command='', verbose=verbose)
-            return output and (re.search(r'DoIP-.* login:', output) is not None)
-        case "HIB":
-            output = send_command_to_serial_device(uart_target, uart_target_port, command='', verbose=verbose)
-            return output and ('GoForHIB>' in output)
-        case "JUMPERS":
-            if verbose:
-                print("  └─ JUMPERS : Check not implemented")
-            return "NOT_IMPLEMENTED"
-        case _:
-            return False
+    if uart_target == "JUMPERS":
+        if verbose:
+            log("  └─ JUMPERS : Check not implemented")
+        return "NOT_IMPLEMENTED"
+    if uart_target not in _UART_PROBES:
+        return False
+
+    command, expected = _UART_PROBES[uart_target]
+    output = send_command_to_serial_device(uart_target, uart_target_port, command=command, verbose=verbose, log=log, ser=ser, expected=expected)
+    if uart_target == "SGA":  # The login prompt contains the host name
+        return output and (_SGA_LOGIN_RE.search(output) is not None)
+    return output and (expected in output)
+
 
-    return False
+def probe_uart_port(item, verbose=True):
+    """
+    Verifies the UART connection of all port map targets on one serial port, used to probe the ports in parallel.
+    The port is opened once (only if a target sends a probe, see _UART_PROBES) and the connection is reused for each of its targets.
+    Args:
+        item (tuple): The serial port and the list of UART targets mapped to it.
+        verbose (bool): Whether to collect detailed communication logs.
+    Returns:
+        dict: The result of `verify_uart_connection` and the buffered communication log lines per target,
+        printed by the caller so the output of parallel probes doesn't interleave.
+    """
+    uart_target_port, uart_targets = item
+    ser = None
+    open_error = None
+    if any(uart_target in _UART_PROBES for uart_target in uart_targets):
+        try:
+            ser = serial.Serial(uart_target_port, DEFAULT_BAUDRATE, timeout=SERIAL_TIMEOUT)
+        except serial.SerialException as e:
+            open_error = e
+
+    results = {}
+    with ser if ser is not None else nullcontext():
+        for uart_target in uart_targets:
+            if open_error is not None and uart_target in _UART_PROBES:
+                results[uart_target] = (False, [f"  └─ Error communicating with {uart_target} ({uart_target_port}): {open_error}"])
+                continue
+            log_lines = []
+            status = verify_uart_connection(uart_target, uart_target_port, verbose=verbose, log=log_lines.append, ser=ser)
+            results[uart_target] = (status, log_lines)
+    return results
 
 
 def main():
@@ -142,11 +209,23 @@ def main():
     and send a command to a serial device.
     """
     parser = argparse.ArgumentParser(description='Test UART VCU Port Mapping')
-    parser.add_argument('--use-script', action='store_true',
-                        help='Use uart_controller.py script instead of built executable')
+    source_group = parser.add_mutually_exclusive_group()
+    source_group.add_argument('--use-script', action='store_true',
+                              help='Use uart_controller.py script instead of built executable')
+    source_group.add_argument('--map', metavar='FILE',
+                              help='Use a port map saved from an earlier UARTVCUPortMap run (e.g. UARTVCUPortMap > portmap.json) instead of scanning the ports again')
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help='Only show the test result (and errors) per port, without the command/response details')
     args = parser.parse_args()
 
-    if args.use_script:
+    if args.map:
+        # Use the saved port map, nothing is executed
+        target_path = args.map
+        if not os.path.isfile(target_path):
+            print(f"Error: Port map file not found at {target_path}")
+            return
+        use_script = False
+    elif args.use_script:
         # Use the Python script directly
         target_path = "UARTVCUPortMap.py"
         if not os.path.isfile(target_path):
@@ -155,10 +234,10 @@ def main():
         use_script = True
     else:
         # Use the built executable (original behavior)
-        if platform.system() == "Windows":
+        if PLATFORM_SYSTEM == "Windows":
             executable_path_primary = "./UARTVCUPortMap.exe"
             executable_path_secondary = "./dist/UARTVCUPortMap.exe"
-        elif platform.system() == "Linux":
+        elif PLATFORM_SYSTEM == "Linux":
             executable_path_primary = "./UARTVCUPortMap"
             executable_path_secondary = "./dist/UARTVCUPortMap"
         else:
@@ -173,13 +252,15 @@ def main():
     print("=" * 60)
     print("UART VCU Port Mapping Test")
     print("=" * 60)
-    if args.use_script:
+    if args.map:
+        print(f"Using port map file: {target_path}")
+    elif args.use_script:
         print("Using Python script: uart_controller.py")
     else:
         print(f"Using executable: {target_path}")
     print("-" * 60)
 
-    output = execute_and_get_json_output(target_path, use_script)
+    output = load_json_output(target_path) if args.map else execute_and_get_json_output(target_path, use_script)
     if output:
         # Fields that shouldn't be tested as serial ports
         non_testable_fields = {'MASTER', 'board_type', 'current_mode', 'previous_mode', 'error', 'UNIDENTIFIED'}
@@ -193,22 +274,31 @@ def main():
         print(f"Master Port: {master_port}")
         print("-" * 60)
         
-        # Test each port
+        # Test each port, the ports are physically independent so the (blocking) serial probes run in parallel
+        testable_items = [(key, value) for key, value in output.items() if key not in non_testable_fields]
+        # Each port is opened once for all the targets mapped to it
+        targets_per_port = {}
+        for key, value in testable_items:
+            if value is not None:
+                targets_per_port.setdefault(value, []).append(key)
+        with ThreadPoolExecutor(max_workers=max(len(targets_per_port), 1)) as executor:
+            port_results = dict(zip(targets_per_port, executor.map(probe_uart_port, targets_per_port.items(), repeat(not args.quiet))))
+
+        # Print the results in the port map order, with the communication logs buffered by each probe
         test_results = []
-        for key, value in output.items():
-            if key in non_testable_fields:
-                continue
-                
+        for key, value in testable_items:
             if value is None:
                 result = "NOT MAPPED"
                 test_results.append((key, "N/A", result))
                 print(f"🔸 {key:<4}: {result}")
                 continue
-                
-            # Test the connection for actual hardware ports only
-            print(f"🔧 Testing {key} ({value})...")
-            
-            status = verify_uart_connection(key, value, verbose=True)
+
+            status, log_lines = port_results[value][key]
+            if not args.quiet:
+                print(f"🔧 Testing {key} ({value})...")
+            for line in log_lines:  # In quiet mode only the error lines are collected, they are always shown
+                print(line)
+
             if status == "NOT_IMPLEMENTED":
                 result = "⚠️  NOT IMPLEMENTED"
             elif status:
@@ -217,7 +307,7 @@ def main():
                 result = "❌ FAIL"
             test_results.append((key, value, result))
             
-            # Always show normal format with verbose output
+            # Always show the result, also in quiet mode
             print(f"🔸 {key:<4}: {result}")
         
         # Summary